@@ -3,16 +3,113 @@ import logging
 import shutil
 import os
 import asyncio
+import time
+import psutil
+from apps.scheduler import HostScheduler
 
 logger = logging.getLogger(__name__)
 
+# Pages with less body text than this are likely error or bot-challenge pages
+MIN_CONTENT_CHARS = 50
+
+# Chromium flags that keep a headless capture browser small: no GPU process,
+# no extensions or background services, and a capped renderer process count.
+LEAN_CHROMIUM_ARGS = [
+    '--disable-gpu',
+    '--disable-extensions',
+    '--disable-component-extensions-with-background-pages',
+    '--disable-background-networking',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-dev-shm-usage',
+    '--no-first-run',
+    '--mute-audio',
+    '--renderer-process-limit=2',
+]
+
+class LaunchProfile:
+    """Browser launch settings.
+
+    Headless and lean by default; set PRICETOOL_BROWSER_HEADED=1 to get a
+    visible, maximized window for debugging.
+    """
+
+    def __init__(self, headless=True, lean=True, width=1280, height=900):
+        self.headless = headless
+        self.lean = lean
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_env(cls):
+        headed = os.environ.get('PRICETOOL_BROWSER_HEADED', '').lower() in ('1', 'true', 'yes')
+        return cls(headless=not headed, lean=not headed)
+
+    def chromium_args(self):
+        args = [
+            f'--window-size={self.width},{self.height}',
+            '--no-sandbox',
+            '--disable-setuid-sandbox',
+        ]
+        if not self.headless:
+            args.insert(0, '--start-maximized')
+        if self.lean:
+            args.extend(LEAN_CHROMIUM_ARGS)
+        return args
+
+    def firefox_args(self):
+        return [f'--window-size={self.width},{self.height}']
+
+class RecyclePolicy:
+    """Limits after which the browser is torn down and relaunched.
+
+    Each limit can be overridden with an environment variable; 0 disables it.
+    """
+
+    def __init__(self, capture_deadline=90, max_captures=200, max_memory_mb=1024, max_deadline_hits=3):
+        self.capture_deadline = capture_deadline
+        self.max_captures = max_captures
+        self.max_memory_mb = max_memory_mb
+        # Consecutive deadline hits after which a connected browser is
+        # considered wedged
+        self.max_deadline_hits = max_deadline_hits
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            capture_deadline=float(os.environ.get('PRICETOOL_CAPTURE_DEADLINE', 90)),
+            max_captures=int(os.environ.get('PRICETOOL_RECYCLE_CAPTURES', 200)),
+            max_memory_mb=float(os.environ.get('PRICETOOL_RECYCLE_MEMORY_MB', 1024)),
+            max_deadline_hits=int(os.environ.get('PRICETOOL_RECYCLE_DEADLINES', 3)),
+        )
+
+class CaptureDeadlineExceeded(Exception):
+    """A capture ran past the hard per-capture deadline and was force-closed."""
+
 class BrowserService:
-    def __init__(self):
+    def __init__(self, profile=None, recycle_policy=None, scheduler=None):
+        self.profile = profile or LaunchProfile.from_env()
+        self.recycle_policy = recycle_policy or RecyclePolicy.from_env()
+        self.scheduler = scheduler or HostScheduler.from_env()
         self.playwright = None
         self.browser = None
         self.context = None
         self._initialized = False
-        self.persistent_page = None
+        self._init_lock = asyncio.Lock()
+        self._recycle_lock = asyncio.Lock()
+        self.cold_start_seconds = None
+        # Watchdog state, reset on every launch
+        self._generation = 0
+        self._active_captures = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._captures_since_launch = 0
+        self._consecutive_deadlines = 0
+        self._recycle_reason = None
+        self.recycle_count = 0
+        # Resident memory of the browser process tree, sampled after each capture
+        self.browser_memory_mb = 0.0
+        self.peak_browser_memory_mb = 0.0
 
     def _find_browser(self):
         """Find installed browsers"""
@@ -39,64 +136,220 @@ class BrowserService:
         return None
 
     async def init_browser(self):
-        if self._initialized:
-            return True
-            
-        try:
-            self.playwright = await async_playwright().start()
-            
-            # Find system browser
-            browser_config = self._find_browser()
-            if not browser_config:
-                logger.error("No supported browser found")
-                return False
+        """Launch the browser and context. Called lazily by the first capture."""
+        async with self._init_lock:
+            if self._initialized:
+                return True
+
+            started = time.monotonic()
+            try:
+                self.playwright = await async_playwright().start()
+
+                # Find system browser
+                browser_config = self._find_browser()
+                if not browser_config:
+                    logger.error("No supported browser found")
+                    await self.cleanup()
+                    return False
 
-            if browser_config['type'] == 'chromium':
-                self.browser = await self.playwright.chromium.launch(
-                    headless=False,
-                    channel=browser_config.get('channel'),
-                    executable_path=browser_config['executablePath'],
-                    args=[
-                        '--start-maximized',
-                        '--window-size=1280,900',
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                    ]
+                if browser_config['type'] == 'chromium':
+                    self.browser = await self.playwright.chromium.launch(
+                        headless=self.profile.headless,
+                        channel=browser_config.get('channel'),
+                        executable_path=browser_config['executablePath'],
+                        args=self.profile.chromium_args()
+                    )
+                else:  # Firefox
+                    self.browser = await self.playwright.firefox.launch(
+                        headless=self.profile.headless,
+                        executable_path=browser_config['executablePath'],
+                        args=self.profile.firefox_args()
+                    )
+
+                self.context = await self.browser.new_context(
+                    viewport={'width': self.profile.width, 'height': self.profile.height},
+                    user_agent='Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
                 )
-            else:  # Firefox
-                self.browser = await self.playwright.firefox.launch(
-                    headless=False,
-                    executable_path=browser_config['executablePath'],
-                    args=[
-                        '--window-size=1280,900'
-                    ]
+
+                self.browser.on('disconnected', self._on_disconnected)
+                self._generation += 1
+                self._captures_since_launch = 0
+                self._consecutive_deadlines = 0
+                self._recycle_reason = None
+                self.browser_memory_mb = 0.0
+                self._initialized = True
+                self.cold_start_seconds = time.monotonic() - started
+                logger.info(
+                    f"Browser started in {self.cold_start_seconds:.2f}s using {browser_config['executablePath']} "
+                    f"({'headless' if self.profile.headless else 'headed'})"
                 )
+                return True
+            except Exception as e:
+                logger.error(f"Failed to initialize browser: {str(e)}")
+                await self.cleanup()
+                return False
 
-            self.context = await self.browser.new_context(
-                viewport={'width': 1280, 'height': 900},
-                user_agent='Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
-            )
-            
-            # Create a persistent page that stays open
-            self.persistent_page = await self.context.new_page()
-            await self.persistent_page.goto('https://www.google.com')
-            
-            self._initialized = True
-            logger.info(f"Browser service initialized successfully using {browser_config['executablePath']}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to initialize browser: {str(e)}")
-            return False
+    def _on_disconnected(self, browser):
+        if browser is self.browser:
+            logger.error("Browser disconnected unexpectedly; it will be relaunched on the next capture")
+
+    def status(self):
+        """Summary of the launch profile and browser state for diagnostics."""
+        return {
+            'running': self._initialized,
+            'alive': self._browser_alive(),
+            'headless': self.profile.headless,
+            'lean': self.profile.lean,
+            'cold_start_seconds': self.cold_start_seconds,
+            'active_captures': self._active_captures,
+            'captures_since_launch': self._captures_since_launch,
+            'recycle_count': self.recycle_count,
+            'browser_memory_mb': round(self.browser_memory_mb, 1),
+            'peak_browser_memory_mb': round(self.peak_browser_memory_mb, 1),
+            'hosts': self.scheduler.stats(),
+        }
 
     async def get_screenshot(self, url):
-        if not self.context:
+        """Capture a screenshot of url, relaunching the browser if it has died.
+
+        A capture that hits the hard deadline is retried once; one that loses
+        its browser mid-flight is retried once on a fresh browser. Repeated
+        deadline hits mark a connected but wedged browser for recycling.
+        Captures are paced per host by the scheduler, which backs off hosts
+        serving minimal pages or errors.
+        """
+        for attempt in (1, 2):
+            # Each attempt takes its own token; only failures the host caused
+            # (navigation errors, minimal content) are reported against it
+            async with self.scheduler.slot(url, adaptive=False) as slot:
+                await self._ensure_browser()
+                generation = self._generation
+                progress = {}
+                try:
+                    screenshot_bytes, body_content = await self._capture_with_deadline(url, progress)
+                    slot.report(ok=body_content >= MIN_CONTENT_CHARS)
+                    return screenshot_bytes
+                except Exception as e:
+                    crashed = generation != self._generation or not self._browser_alive()
+                    if progress.get('page_opened') and not crashed:
+                        slot.report(ok=False)
+                    if attempt == 1 and crashed:
+                        logger.warning(f"Retrying capture of {url} on a fresh browser (browser crashed)")
+                        await self.recycle('browser crashed', generation=generation)
+                        continue
+                    if attempt == 1 and isinstance(e, CaptureDeadlineExceeded):
+                        # The stuck page is already closed; other captures on
+                        # this browser are unaffected, so keep it
+                        logger.warning(f"Retrying capture of {url} ({str(e)})")
+                        continue
+                    raise
+
+    async def _ensure_browser(self):
+        """Health-check the browser before a capture and recycle it if needed."""
+        if self._initialized and not self._browser_alive():
+            await self.recycle('browser disconnected', generation=self._generation)
+        elif self._recycle_reason:
+            # Let in-flight captures finish before swapping the browser out
+            generation = self._generation
+            await self._idle.wait()
+            if self._recycle_reason:
+                await self.recycle(self._recycle_reason, generation=generation)
+
+        if not self._initialized:
             if not await self.init_browser():
                 raise Exception("Browser not available")
 
-        page = None
+    def _browser_alive(self):
+        try:
+            return self.browser is not None and self.browser.is_connected()
+        except Exception:
+            return False
+
+    async def recycle(self, reason, generation=None):
+        """Tear down and relaunch the browser and context.
+
+        When generation is given the recycle is skipped if another caller has
+        already replaced that browser, so concurrent failures relaunch once.
+        """
+        async with self._recycle_lock:
+            if generation is not None and generation != self._generation:
+                return
+            logger.warning(f"Recycling browser after {self._captures_since_launch} captures: {reason}")
+            self.recycle_count += 1
+            await self.cleanup()
+            await self.init_browser()
+
+    async def _capture_with_deadline(self, url, progress):
+        self._active_captures += 1
+        self._idle.clear()
+        pages = []
+        context = self.context
+
+        async def open_and_capture():
+            # Opening the page is covered by the deadline too, since a wedged
+            # browser can hang in new_page while staying connected
+            page = await context.new_page()
+            pages.append(page)
+            progress['page_opened'] = True
+            return await self._capture(page, url)
+
+        try:
+            result = await asyncio.wait_for(
+                open_and_capture(),
+                timeout=self.recycle_policy.capture_deadline
+            )
+            self._consecutive_deadlines = 0
+            return result
+        except asyncio.TimeoutError:
+            self._consecutive_deadlines += 1
+            raise CaptureDeadlineExceeded(
+                f"capture exceeded {self.recycle_policy.capture_deadline}s deadline"
+            )
+        finally:
+            for page in pages:
+                # Force-close so a hung page cannot pin renderer memory
+                try:
+                    await asyncio.wait_for(page.close(), timeout=5)
+                except Exception:
+                    pass
+            self._captures_since_launch += 1
+            self._sample_browser_memory()
+            self._check_recycle_thresholds()
+            self._active_captures -= 1
+            if self._active_captures == 0:
+                self._idle.set()
+
+    def _check_recycle_thresholds(self):
+        policy = self.recycle_policy
+        if policy.max_deadline_hits and self._consecutive_deadlines >= policy.max_deadline_hits:
+            self._recycle_reason = f"{self._consecutive_deadlines} consecutive captures hit the deadline"
+        elif policy.max_captures and self._captures_since_launch >= policy.max_captures:
+            self._recycle_reason = f"reached {policy.max_captures} captures"
+        elif policy.max_memory_mb and self.browser_memory_mb >= policy.max_memory_mb:
+            self._recycle_reason = f"browser memory {self.browser_memory_mb:.0f}MB over {policy.max_memory_mb}MB"
+
+    def _sample_browser_memory(self):
+        """Record the resident memory of the browser and renderer processes.
+
+        Playwright starts the browser under its driver, so the processes are
+        descendants of this one. Measuring the whole tree after the page is
+        closed catches memory that builds up across captures.
+        """
+        total = 0
+        try:
+            for child in psutil.Process().children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    continue
+        except psutil.Error as e:
+            logger.debug(f"Browser memory sample failed: {str(e)}")
+            return
+        self.browser_memory_mb = total / (1024 * 1024)
+        self.peak_browser_memory_mb = max(self.peak_browser_memory_mb, self.browser_memory_mb)
+
+    async def _capture(self, page, url):
         try:
-            page = await self.context.new_page()
-            
             # Create a dialog handler function
             async def handle_dialog(dialog):
                 await dialog.accept()
@@ -173,7 +426,7 @@ class BrowserService:
 
             # Check if page has content before taking screenshot
             body_content = await page.evaluate("document.body.textContent.length")
-            if body_content < 50:  # Arbitrary threshold for empty/error pages
+            if body_content < MIN_CONTENT_CHARS:
                 logger.warning(f"Page content seems minimal ({body_content} chars), might be an error page")
             
             # Gentle scroll to trigger lazy loading
@@ -194,36 +447,37 @@ class BrowserService:
                 quality=90
             )
             
-            await page.close()  # Close the page properly
             logger.info("Screenshot captured successfully")
-            return screenshot_bytes
+            return screenshot_bytes, body_content
 
         except Exception as e:
             logger.error(f"Screenshot error: {str(e)}")
-            if page:
-                # Try to get page error information if available
-                try:
-                    url_status = await page.evaluate("() => ({ url: window.location.href, title: document.title })")
-                    logger.error(f"Page state at error: URL={url_status.get('url')}, Title={url_status.get('title')}")
-                except:
-                    pass
-                    
-                try:
-                    await page.close()
-                except:
-                    pass
+            # Try to get page error information if available
+            try:
+                url_status = await asyncio.wait_for(
+                    page.evaluate("() => ({ url: window.location.href, title: document.title })"),
+                    timeout=2
+                )
+                logger.error(f"Page state at error: URL={url_status.get('url')}, Title={url_status.get('title')}")
+            except:
+                pass
             raise
 
     async def cleanup(self):
         try:
-            if self.context:
-                await self.context.close()
-            if self.browser:
-                await self.browser.close()
-            if self.playwright:
-                await self.playwright.stop()
-        except Exception as e:
-            logger.error(f"Cleanup error: {str(e)}")
+            # Close each layer separately so a crashed browser still lets
+            # the playwright driver shut down.
+            for closer in (
+                self.context.close if self.context else None,
+                self.browser.close if self.browser else None,
+                self.playwright.stop if self.playwright else None,
+            ):
+                if closer is None:
+                    continue
+                try:
+                    await asyncio.wait_for(closer(), timeout=10)
+                except Exception as e:
+                    logger.error(f"Cleanup error: {str(e)}")
         finally:
             self.playwright = None
             self.browser = None
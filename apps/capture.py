@@ -0,0 +1,159 @@
+from apps.database import (
+    Session, Website, create_website, record_price_update, record_unchanged_price, update_capture_state
+)
+from apps.ollama import process_image
+from PIL import Image
+from datetime import datetime, timezone, timedelta
+import asyncio
+import io
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+ITEM_PROMPT = """Analyze the image and respond exclusively with a JSON object containing the following keys:
+                description: A brief description of the item in the image, or not found if unavailable.
+                price: The item's price in the image, or not found if unavailable.
+
+                Do not include any additional text outside the JSON object."""
+
+# Force a full capture at least this often even if the HTML looks unchanged,
+# since prices rendered by JavaScript do not show up in the raw HTML
+MAX_SKIP_AGE = timedelta(hours=float(os.environ.get('PRICETOOL_PRECHECK_MAX_AGE_HOURS', 24)))
+
+class CaptureError(Exception):
+    """The page could be captured but no item price was found on it."""
+
+async def extract_item_details(screenshot_bytes):
+    """
+    Ask the vision model for the item shown in a screenshot.
+
+    Returns:
+        tuple: (description, price_str), either may be 'not found'
+
+    Raises:
+        json.JSONDecodeError: If the model did not answer with JSON
+    """
+    screenshot = Image.open(io.BytesIO(screenshot_bytes))
+    # Inference blocks for seconds; keep it off the event loop
+    ollama_response = await asyncio.to_thread(
+        process_image,
+        image=screenshot,
+        prompt=ITEM_PROMPT,
+        stream=False
+    )
+    logger.debug(f"Ollama Response: {ollama_response}")
+
+    response = json.loads(ollama_response["message"]["content"])
+    return response.get('description', 'not found'), response.get('price', 'not found')
+
+def is_unreachable(description, price_str):
+    """Whether the model's answer means the site could not be read"""
+    return description == 'This site cannot be reached' or price_str == 'not found'
+
+def _as_utc(value):
+    # SQLite returns naive datetimes for values stored in UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def _load_capture_state(website_id):
+    session = Session()
+    try:
+        website = session.query(Website).get(website_id)
+        if website:
+            session.expunge(website)
+        return website
+    finally:
+        session.close()
+
+async def add_website(url, browser_service, before_write=None):
+    """
+    Capture a new item page and start tracking it.
+
+    before_write, if given, is called just before the database is written
+    and may raise to abort.
+
+    Returns:
+        int: The new website's id
+
+    Raises:
+        CaptureError: If the site could not be read or shows no price
+    """
+    screenshot_bytes = await browser_service.get_screenshot(url)
+    description, price_str = await extract_item_details(screenshot_bytes)
+    if is_unreachable(description, price_str):
+        raise CaptureError(f"Unable to access {url}")
+
+    def write():
+        if before_write:
+            before_write()
+        return create_website(url, description, price_str, screenshot_bytes)
+
+    # SQLite writes can wait on the busy timeout; keep them off the event loop
+    return await asyncio.to_thread(write)
+
+async def refresh_website(website_id, browser_service, change_detector=None, before_write=None):
+    """
+    Refresh one tracked website's price.
+
+    When a change detector is given, an HTTP pre-check runs first; if the page
+    is unchanged and was fully captured recently, an unchanged price point is
+    recorded without opening a browser page. before_write, if given, is
+    called just before the database is written and may raise to abort.
+
+    Returns:
+        str: 'unchanged', 'updated', or None if the website does not exist
+
+    Raises:
+        CaptureError: If no price could be read from the page
+    """
+    website = await asyncio.to_thread(_load_capture_state, website_id)
+    if not website:
+        return None
+    url = website.url
+    etag, last_modified, content_hash = website.etag, website.last_modified, website.content_hash
+    last_captured = _as_utc(website.last_captured)
+
+    precheck = None
+    if change_detector:
+        precheck = await change_detector.check(url, etag, last_modified, content_hash)
+        recently_captured = last_captured and datetime.now(timezone.utc) - last_captured < MAX_SKIP_AGE
+        if precheck.unchanged and recently_captured:
+            logger.info(f"Skipping capture of {url}: {precheck.reason}")
+
+            def write_unchanged():
+                if before_write:
+                    before_write()
+                record_unchanged_price(website_id)
+                update_capture_state(website_id, precheck.etag, precheck.last_modified, precheck.content_hash)
+
+            await asyncio.to_thread(write_unchanged)
+            change_detector.record_skip(url)
+            return 'unchanged'
+
+    screenshot_bytes = await browser_service.get_screenshot(url)
+    description, price_str = await extract_item_details(screenshot_bytes)
+    if is_unreachable(description, price_str):
+        raise CaptureError(f"No price found on {url}")
+
+    if precheck and precheck.content_hash is not None:
+        etag, last_modified, content_hash = precheck.etag, precheck.last_modified, precheck.content_hash
+    # Otherwise the pre-check failed or did not run; keep the stored validators
+
+    def write_update():
+        if before_write:
+            before_write()
+        record_price_update(website_id, price_str, scraped_description=description)
+        update_capture_state(
+            website_id,
+            etag=etag,
+            last_modified=last_modified,
+            content_hash=content_hash,
+            image_data=screenshot_bytes,
+            captured=True
+        )
+
+    await asyncio.to_thread(write_update)
+    return 'updated'
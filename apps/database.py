@@ -1,8 +1,15 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, LargeBinary, DateTime, Boolean, ForeignKey, Table
+from sqlalchemy import (
+    create_engine, Column, Integer, String, Float, LargeBinary, DateTime, Boolean, ForeignKey, Table,
+    inspect, text, func, or_, and_
+)
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime, timezone
+from sqlalchemy.orm import sessionmaker, relationship, validates
+from datetime import datetime, timezone, timedelta
+from apps.scheduler import host_key
 import os
+import json
 import hashlib
 import re
 from PIL import Image
@@ -12,9 +19,22 @@ import io
 db_dir = os.path.join(os.path.dirname(__file__), 'databases')
 os.makedirs(db_dir, exist_ok=True)
 
-# Update database path
+# Update database path; PRICETOOL_DATABASE_URL lets web and worker
+# processes on several machines point at one shared job store
 db_path = os.path.join(db_dir, 'price_tool.db')
-engine = create_engine(f'sqlite:///{db_path}')
+database_url = os.environ.get('PRICETOOL_DATABASE_URL', f'sqlite:///{db_path}')
+engine = create_engine(
+    database_url,
+    connect_args={'timeout': 30} if database_url.startswith('sqlite') else {}
+)
+
+if engine.dialect.name == 'sqlite':
+    @event.listens_for(engine, 'connect')
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets the web process read while workers write
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.close()
 
 # Initialize SQLAlchemy
 Base = declarative_base()
@@ -47,16 +67,29 @@ class Website(Base):
     id = Column(Integer, primary_key=True)
     description = Column(String, nullable=False)
     url = Column(String, unique=True, nullable=False)
+    domain = Column(String, index=True)  # Host key derived from url, for filtering
     current_price = Column(Float)
+    previous_price = Column(Float)  # Price before the latest update, for change sorting
     currency = Column(String, default='$')  # Store currency symbol
     image_data = Column(LargeBinary)  # Store image binary data
     image_hash = Column(String)  # Store image hash for comparison
-    last_updated = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    last_updated = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    last_captured = Column(DateTime)  # Last full browser capture
+    # HTTP validators from the last capture, used to skip unchanged pages
+    etag = Column(String)
+    last_modified = Column(String)
+    content_hash = Column(String)  # Hash of the normalized HTML body
     
     # Update relationships with cascade delete
     price_history = relationship("PriceHistory", back_populates="website", cascade="all, delete-orphan")
     alerts = relationship("Alert", back_populates="website", cascade="all, delete-orphan")
     users = relationship("User", secondary=user_website, back_populates="websites")
+    jobs = relationship("CaptureJob", back_populates="website", cascade="all, delete-orphan")
+
+    @validates('url')
+    def _set_domain(self, key, url):
+        self.domain = host_key(url)
+        return url
 
 class PriceHistory(Base):
     __tablename__ = 'price_history'
@@ -89,9 +122,90 @@ class Alert(Base):
     user = relationship("User", back_populates="alerts")
     website = relationship("Website", back_populates="alerts")
 
+class CaptureJob(Base):
+    __tablename__ = 'capture_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # 'add' or 'refresh'
+    website_id = Column(Integer, ForeignKey('websites.id'))  # Set for refresh jobs
+    url = Column(String)  # Set for add jobs
+    domain = Column(String, index=True)  # Host key, for cross-worker pacing
+    status = Column(String, default='pending', nullable=False, index=True)  # pending, running, done, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    worker_id = Column(String)
+    available_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))  # Retry backoff
+    lease_expires_at = Column(DateTime)
+    last_error = Column(String)
+    result = Column(String)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime)
+    
+    # Relationship
+    website = relationship("Website", back_populates="jobs")
+
+class HostPacing(Base):
+    __tablename__ = 'host_pacing'
+    
+    domain = Column(String, primary_key=True)
+    next_allowed_at = Column(DateTime, nullable=False)  # Earliest start of the next capture
+
+class WorkerStatus(Base):
+    __tablename__ = 'worker_status'
+    
+    worker_id = Column(String, primary_key=True)
+    browser_status = Column(String)  # JSON from BrowserService.status()
+    precheck_stats = Column(String)  # JSON from ChangeDetector.stats()
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
 def init_db():
     """Initialize the database, creating tables if they don't exist"""
     Base.metadata.create_all(engine)
+    _migrate_websites()
+    _migrate_capture_jobs()
+
+def _migrate_websites():
+    """Add website columns introduced after a database was first created"""
+    existing = {column['name'] for column in inspect(engine).get_columns('websites')}
+    added_columns = {
+        'previous_price': 'FLOAT',
+        'last_captured': 'DATETIME',
+        'etag': 'VARCHAR',
+        'last_modified': 'VARCHAR',
+        'content_hash': 'VARCHAR',
+    }
+    with engine.begin() as conn:
+        for name, column_type in added_columns.items():
+            if name not in existing:
+                conn.execute(text(f'ALTER TABLE websites ADD COLUMN {name} {column_type}'))
+        if 'domain' not in existing:
+            conn.execute(text('ALTER TABLE websites ADD COLUMN domain VARCHAR'))
+            for website_id, url in conn.execute(text('SELECT id, url FROM websites')).all():
+                conn.execute(
+                    text('UPDATE websites SET domain = :domain WHERE id = :id'),
+                    {'domain': host_key(url), 'id': website_id}
+                )
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_websites_domain ON websites (domain)'))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_websites_last_updated ON websites (last_updated)'))
+
+def _migrate_capture_jobs():
+    """Add capture job columns introduced after the table was first created"""
+    existing = {column['name'] for column in inspect(engine).get_columns('capture_jobs')}
+    if 'domain' in existing:
+        return
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE capture_jobs ADD COLUMN domain VARCHAR'))
+        conn.execute(text(
+            'UPDATE capture_jobs SET domain = '
+            '(SELECT domain FROM websites WHERE websites.id = capture_jobs.website_id) '
+            'WHERE website_id IS NOT NULL'
+        ))
+        for job_id, url in conn.execute(text('SELECT id, url FROM capture_jobs WHERE url IS NOT NULL')).all():
+            conn.execute(
+                text('UPDATE capture_jobs SET domain = :domain WHERE id = :id'),
+                {'domain': host_key(url), 'id': job_id}
+            )
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_capture_jobs_domain ON capture_jobs (domain)'))
 
 def extract_price_info(price_str):
     """
@@ -153,6 +267,7 @@ def record_price_update(website_id, price_str, scraped_description=None):
             # Extract price and currency
             price_float, currency, raw_price = extract_price_info(price_str)
             
+            website.previous_price = website.current_price
             website.current_price = price_float
             website.currency = currency
             website.last_updated = datetime.now(timezone.utc)
@@ -180,6 +295,81 @@ def record_price_update(website_id, price_str, scraped_description=None):
     finally:
         session.close()
 
+def record_unchanged_price(website_id):
+    """Record a price point carrying the current price forward for a page
+    that a pre-check found unchanged, without touching previous_price"""
+    session = Session()
+    try:
+        website = session.query(Website).get(website_id)
+        if website:
+            website.last_updated = datetime.now(timezone.utc)
+            if website.current_price is not None:
+                session.add(PriceHistory(
+                    website_id=website_id,
+                    price=website.current_price,
+                    currency=website.currency,
+                    scraped_description='unchanged'
+                ))
+            session.commit()
+            return True
+        return False
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def update_capture_state(website_id, etag=None, last_modified=None, content_hash=None,
+                         image_data=None, captured=False):
+    """Store the HTTP validators (and optionally screenshot) for a website"""
+    session = Session()
+    try:
+        website = session.query(Website).get(website_id)
+        if website:
+            website.etag = etag
+            website.last_modified = last_modified
+            website.content_hash = content_hash
+            if image_data is not None:
+                website.image_data = image_data
+            if captured:
+                website.last_captured = datetime.now(timezone.utc)
+            session.commit()
+            return True
+        return False
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def create_website(url, description, price_str, image_data):
+    """Create a tracked website from a first capture and record its initial price"""
+    price_float, currency, raw_price = extract_price_info(price_str)
+    
+    session = Session()
+    try:
+        now = datetime.now(timezone.utc)
+        website = Website(
+            url=url,
+            description=description if description != 'not found' else url,
+            current_price=price_float,
+            currency=currency,
+            image_data=image_data,
+            last_updated=now,
+            last_captured=now
+        )
+        session.add(website)
+        session.commit()
+        website_id = website.id
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+    
+    record_price_update(website_id, price_str, scraped_description=description)
+    return website_id
+
 def create_alert(user_id, website_id, target_price, is_below_target=True):
     """Create a new price alert"""
     session = Session()
@@ -235,7 +425,6 @@ def get_price_history(website_id, days=30):
     session = Session()
     try:
         from sqlalchemy import desc
-        from datetime import timedelta
         
         cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
         
@@ -271,4 +460,364 @@ def delete_website(url):
         session.rollback()
         raise e
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+def _price_change():
+    return func.coalesce(Website.current_price - Website.previous_price, 0.0)
+
+def _encode_cursor(sort, value, website_id):
+    if sort == 'change':
+        return f"{value!r}|{website_id}"
+    return f"{value.isoformat()}|{website_id}"
+
+def _decode_cursor(sort, cursor):
+    value, website_id = cursor.rsplit('|', 1)
+    if sort == 'change':
+        return float(value), int(website_id)
+    return datetime.fromisoformat(value), int(website_id)
+
+def get_websites_page(sort='updated', descending=True, domain=None, change=None,
+                      updated_days=None, cursor=None, limit=20):
+    """
+    Get one page of websites for the dashboard using keyset pagination.
+    
+    Args:
+        sort (str): 'updated' (last_updated) or 'change' (latest price change)
+        descending (bool): Sort direction
+        domain (str): Only include websites on this host key
+        change (str): 'down', 'up' or 'same' to filter by latest price change
+        updated_days (int): Only include websites updated in the last N days
+        cursor (str): Opaque cursor returned for the previous page
+        limit (int): Page size
+        
+    Returns:
+        tuple: (rows, next_cursor) where rows carry only the card's columns
+               and next_cursor is None on the last page
+    """
+    session = Session()
+    try:
+        price_change = _price_change()
+        sort_column = price_change if sort == 'change' else Website.last_updated
+        
+        query = session.query(
+            Website.id,
+            Website.url,
+            Website.description,
+            Website.current_price,
+            Website.currency,
+            Website.last_updated,
+            Website.image_data.isnot(None).label('has_image'),
+            price_change.label('price_change'),
+            sort_column.label('sort_value')
+        )
+        
+        if domain:
+            query = query.filter(Website.domain == domain)
+        if change == 'down':
+            query = query.filter(price_change < 0)
+        elif change == 'up':
+            query = query.filter(price_change > 0)
+        elif change == 'same':
+            query = query.filter(price_change == 0)
+        if updated_days:
+            cutoff_date = datetime.now(timezone.utc) - timedelta(days=updated_days)
+            query = query.filter(Website.last_updated >= cutoff_date)
+        
+        if cursor:
+            value, last_id = _decode_cursor(sort, cursor)
+            if descending:
+                query = query.filter(or_(
+                    sort_column < value,
+                    and_(sort_column == value, Website.id < last_id)
+                ))
+            else:
+                query = query.filter(or_(
+                    sort_column > value,
+                    and_(sort_column == value, Website.id > last_id)
+                ))
+        
+        if descending:
+            query = query.order_by(sort_column.desc(), Website.id.desc())
+        else:
+            query = query.order_by(sort_column.asc(), Website.id.asc())
+        
+        rows = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(sort, rows[-1].sort_value, rows[-1].id)
+        return rows, next_cursor
+    finally:
+        session.close()
+
+def get_domains():
+    """Get the distinct host keys of all tracked websites"""
+    session = Session()
+    try:
+        rows = session.query(Website.domain).filter(Website.domain.isnot(None)).distinct().order_by(Website.domain)
+        return [domain for domain, in rows]
+    finally:
+        session.close()
+
+def get_website_image(website_id):
+    """Get the stored screenshot bytes for a website, or None"""
+    session = Session()
+    try:
+        row = session.query(Website.image_data).filter(Website.id == website_id).first()
+        return row.image_data if row else None
+    finally:
+        session.close()
+
+
+def enqueue_job(kind, website_id=None, url=None, max_attempts=3):
+    """
+    Queue a capture job for the worker processes.
+    
+    Returns:
+        int: The new job's id, or the id of an equivalent job that is
+             already pending or running
+    """
+    session = Session()
+    try:
+        existing = session.query(CaptureJob.id).filter(
+            CaptureJob.kind == kind,
+            CaptureJob.website_id == website_id,
+            CaptureJob.url == url,
+            CaptureJob.status.in_(('pending', 'running'))
+        ).first()
+        if existing:
+            return existing.id
+        
+        if url:
+            domain = host_key(url)
+        else:
+            domain = session.query(Website.domain).filter(Website.id == website_id).scalar()
+        job = CaptureJob(kind=kind, website_id=website_id, url=url, domain=domain,
+                         max_attempts=max_attempts)
+        session.add(job)
+        session.commit()
+        return job.id
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+# How many runnable jobs claim_job looks at when skipping paced hosts
+CLAIM_SCAN_LIMIT = 200
+
+def _reserve_host(session, domain, now, interval):
+    """Take a host's next capture turn in the shared pacing table.
+
+    Runs in the claiming transaction, so the reservation is rolled back if
+    the job claim fails.
+    """
+    next_allowed_at = now + timedelta(seconds=interval)
+    reserved = session.query(HostPacing).filter(
+        HostPacing.domain == domain,
+        HostPacing.next_allowed_at <= now
+    ).update({'next_allowed_at': next_allowed_at}, synchronize_session=False)
+    if reserved:
+        return True
+    if session.query(HostPacing.domain).filter_by(domain=domain).first():
+        return False
+    session.add(HostPacing(domain=domain, next_allowed_at=next_allowed_at))
+    try:
+        session.flush()
+    except IntegrityError:
+        return False
+    return True
+
+def claim_job(worker_id, lease_seconds, policy_for=None):
+    """
+    Claim the oldest runnable job for a worker.
+    
+    A job is runnable when it is pending and its backoff has passed, or when
+    it is running but its lease expired because the worker holding it died.
+    The claim is a conditional UPDATE, so concurrent workers never get the
+    same job.
+    
+    When policy_for (domain -> HostPolicy) is given, per-host limits are
+    enforced across all workers sharing the database: a job is skipped while
+    its host already has max_concurrent leased jobs or its next turn in the
+    host_pacing table (one every 1/rate seconds) has not come yet. Skipped
+    hosts let jobs for other hosts go first.
+    
+    Returns:
+        CaptureJob: The claimed (detached) job, or None if nothing is runnable
+    """
+    session = Session()
+    try:
+        now = datetime.now(timezone.utc)
+        runnable = or_(
+            and_(CaptureJob.status == 'pending', CaptureJob.available_at <= now),
+            and_(CaptureJob.status == 'running', CaptureJob.lease_expires_at < now)
+        )
+        busy, paced = {}, set()
+        if policy_for:
+            busy = dict(session.query(CaptureJob.domain, func.count(CaptureJob.id)).filter(
+                CaptureJob.status == 'running',
+                CaptureJob.lease_expires_at >= now
+            ).group_by(CaptureJob.domain).all())
+            paced = {domain for domain, in session.query(HostPacing.domain).filter(
+                HostPacing.next_allowed_at > now
+            )}
+        
+        candidates = session.query(CaptureJob).filter(runnable).order_by(CaptureJob.id).limit(CLAIM_SCAN_LIMIT).all()
+        for job in candidates:
+            job_id, attempts, domain = job.id, job.attempts, job.domain
+            if attempts >= job.max_attempts:
+                # Its last worker died mid-attempt; give up on it
+                job.status = 'failed'
+                job.last_error = job.last_error or 'Lease expired on final attempt'
+                job.finished_at = now
+                session.commit()
+                continue
+            
+            if policy_for and domain:
+                policy = policy_for(domain)
+                if domain in paced or busy.get(domain, 0) >= policy.max_concurrent:
+                    continue
+                if not _reserve_host(session, domain, now, 1 / policy.rate):
+                    session.rollback()
+                    paced.add(domain)
+                    continue
+            
+            claimed = session.query(CaptureJob).filter(
+                CaptureJob.id == job_id,
+                CaptureJob.attempts == attempts,
+                runnable
+            ).update({
+                'status': 'running',
+                'worker_id': worker_id,
+                'attempts': attempts + 1,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds)
+            }, synchronize_session=False)
+            if claimed:
+                session.commit()
+                session.refresh(job)
+                session.expunge(job)
+                return job
+            session.rollback()
+        return None
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def _update_owned_job(job_id, worker_id, values):
+    session = Session()
+    try:
+        updated = session.query(CaptureJob).filter(
+            CaptureJob.id == job_id,
+            CaptureJob.worker_id == worker_id,
+            CaptureJob.status == 'running'
+        ).update(values, synchronize_session=False)
+        session.commit()
+        return bool(updated)
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def heartbeat_job(job_id, worker_id, lease_seconds):
+    """Extend a running job's lease. Returns False if the worker lost the lease."""
+    return _update_owned_job(job_id, worker_id, {
+        'lease_expires_at': datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+    })
+
+def complete_job(job_id, worker_id, result=None):
+    """Mark a job done"""
+    return _update_owned_job(job_id, worker_id, {
+        'status': 'done',
+        'result': result,
+        'lease_expires_at': None,
+        'finished_at': datetime.now(timezone.utc)
+    })
+
+def fail_job(job_id, worker_id, error, retry_delay=None):
+    """
+    Record a failed attempt. The job goes back to pending after retry_delay
+    seconds, or is marked failed when retry_delay is None or no attempts remain.
+    """
+    session = Session()
+    try:
+        job = session.query(CaptureJob).filter_by(id=job_id, worker_id=worker_id, status='running').first()
+        if not job:
+            return False
+        now = datetime.now(timezone.utc)
+        job.last_error = error
+        job.lease_expires_at = None
+        if retry_delay is not None and job.attempts < job.max_attempts:
+            job.status = 'pending'
+            job.available_at = now + timedelta(seconds=retry_delay)
+        else:
+            job.status = 'failed'
+            job.finished_at = now
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def get_job_counts():
+    """Get the number of capture jobs in each status"""
+    session = Session()
+    try:
+        rows = session.query(CaptureJob.status, func.count(CaptureJob.id)).group_by(CaptureJob.status)
+        return {status: count for status, count in rows}
+    finally:
+        session.close()
+
+def get_failed_jobs(limit=20):
+    """Get the most recently failed capture jobs"""
+    session = Session()
+    try:
+        return session.query(CaptureJob).filter_by(status='failed').order_by(
+            CaptureJob.finished_at.desc(), CaptureJob.id.desc()
+        ).limit(limit).all()
+    finally:
+        session.close()
+
+def get_website_ids():
+    """Get the ids of all tracked websites"""
+    session = Session()
+    try:
+        return [website_id for website_id, in session.query(Website.id).order_by(Website.id)]
+    finally:
+        session.close()
+
+
+def save_worker_status(worker_id, browser_status, precheck_stats):
+    """Store a worker's latest browser and pre-check stats for the web process"""
+    session = Session()
+    try:
+        session.merge(WorkerStatus(
+            worker_id=worker_id,
+            browser_status=json.dumps(browser_status),
+            precheck_stats=json.dumps(precheck_stats),
+            updated_at=datetime.now(timezone.utc)
+        ))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise e
+    finally:
+        session.close()
+
+def get_worker_statuses():
+    """Get every worker's last reported stats as dicts"""
+    session = Session()
+    try:
+        return [{
+            'worker_id': status.worker_id,
+            'updated_at': status.updated_at.isoformat() if status.updated_at else None,
+            'browser': json.loads(status.browser_status or '{}'),
+            'precheck': json.loads(status.precheck_stats or '{}')
+        } for status in session.query(WorkerStatus).order_by(WorkerStatus.worker_id)]
+    finally:
+        session.close()
@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import os
+import re
+
+import httpx
+
+from apps.scheduler import HostScheduler, host_key
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'
+
+# Markup that changes between requests without the product changing
+_VOLATILE_PATTERNS = [
+    re.compile(r'<script\b.*?</script>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<style\b.*?</style>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<noscript\b.*?</noscript>', re.IGNORECASE | re.DOTALL),
+    re.compile(r'<!--.*?-->', re.DOTALL),
+    re.compile(r'\s(?:nonce|data-csrf|data-request-id|data-timestamp)="[^"]*"', re.IGNORECASE),
+]
+_WHITESPACE = re.compile(r'\s+')
+
+def normalized_html_hash(html):
+    """Hash of an HTML body with scripts, styles, comments and whitespace removed"""
+    for pattern in _VOLATILE_PATTERNS:
+        html = pattern.sub('', html)
+    html = _WHITESPACE.sub(' ', html).strip()
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+def _with_shortcut_rate(counts):
+    return {
+        domain: dict(stats, shortcut_rate=round(stats['skipped'] / stats['checks'], 3) if stats['checks'] else 0.0)
+        for domain, stats in counts.items()
+    }
+
+def merge_stats(stats_list):
+    """Sum per-domain stats reported by several ChangeDetectors (e.g. one per worker)"""
+    totals = {}
+    for stats in stats_list:
+        for domain, counts in stats.items():
+            merged = totals.setdefault(domain, {})
+            for key, value in counts.items():
+                if key != 'shortcut_rate':
+                    merged[key] = merged.get(key, 0) + value
+    return _with_shortcut_rate(totals)
+
+class PrecheckResult:
+    """Outcome of a pre-check; carries the validators to store after a capture."""
+
+    def __init__(self, unchanged, etag=None, last_modified=None, content_hash=None, reason=None):
+        self.unchanged = unchanged
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.reason = reason
+
+class ChangeDetector:
+    """Cheap HTTP check that decides whether a page needs a full browser capture.
+
+    Sends a conditional GET with the stored ETag/Last-Modified and, when the
+    server does not honour it, compares a normalized hash of the HTML body
+    with the one stored at the last capture.
+
+    Requests are paced per host by a scheduler of their own, separate from
+    the browser's, and never report outcomes to it: only browser captures
+    drive a host's backoff.
+    """
+
+    def __init__(self, scheduler=None, max_connections=20, timeout=10.0):
+        self.scheduler = scheduler or HostScheduler.from_env()
+        self.client = httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT, 'Accept': 'text/html,application/xhtml+xml'},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+            follow_redirects=True
+        )
+        self._stats = {}
+
+    @classmethod
+    def from_env(cls, scheduler=None):
+        return cls(
+            scheduler=scheduler,
+            max_connections=int(os.environ.get('PRICETOOL_PRECHECK_CONNECTIONS', 20)),
+            timeout=float(os.environ.get('PRICETOOL_PRECHECK_TIMEOUT', 10)),
+        )
+
+    async def check(self, url, etag=None, last_modified=None, content_hash=None):
+        """Return a PrecheckResult; any failure means "changed" so the caller captures."""
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        try:
+            async with self.scheduler.slot(url, adaptive=False):
+                response = await self.client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            logger.warning(f"Pre-check failed for {url}: {str(e)}")
+            self._record(url, 'errors')
+            return PrecheckResult(False, reason='error')
+
+        new_etag = response.headers.get('ETag', etag)
+        new_last_modified = response.headers.get('Last-Modified', last_modified)
+
+        if response.status_code == 304:
+            self._record(url, 'not_modified')
+            return PrecheckResult(True, new_etag, new_last_modified, content_hash, reason='not modified')
+
+        if response.status_code != 200:
+            self._record(url, 'errors')
+            return PrecheckResult(False, reason=f'HTTP {response.status_code}')
+
+        new_hash = normalized_html_hash(response.text)
+        if content_hash and new_hash == content_hash:
+            self._record(url, 'same_hash')
+            return PrecheckResult(True, new_etag, new_last_modified, new_hash, reason='same content')
+
+        self._record(url, 'changed')
+        return PrecheckResult(False, new_etag, new_last_modified, new_hash, reason='changed')
+
+    def _record(self, url, outcome, count_check=True):
+        stats = self._stats.setdefault(host_key(url), {
+            'checks': 0, 'not_modified': 0, 'same_hash': 0, 'changed': 0, 'errors': 0, 'skipped': 0
+        })
+        if count_check:
+            stats['checks'] += 1
+        stats[outcome] += 1
+
+    def record_skip(self, url):
+        """Count a browser capture that was actually skipped after a pre-check"""
+        self._record(url, 'skipped', count_check=False)
+
+    def stats(self):
+        """Per-domain counts; shortcut_rate is the share of checks that skipped the browser"""
+        return _with_shortcut_rate(self._stats)
+
+    async def close(self):
+        await self.client.aclose()
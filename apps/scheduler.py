@@ -0,0 +1,160 @@
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+def host_key(url):
+    """Politeness key for a tracked URL: its lowercased host without 'www.'"""
+    host = (urlparse(url).hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+class HostPolicy:
+    """Rate and concurrency budget for one host.
+
+    rate is captures per second, burst is how many captures may start back to
+    back after the host has been idle, max_concurrent caps open pages.
+    """
+
+    def __init__(self, rate=0.5, burst=2, max_concurrent=2):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+
+class _HostState:
+    def __init__(self, policy):
+        self.policy = policy
+        self.tokens = float(policy.burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.semaphore = asyncio.Semaphore(policy.max_concurrent)
+        # Backoff multiplier on the refill interval, raised when the host
+        # serves empty/challenge pages or errors and eased on clean captures.
+        self.penalty = 1.0
+        self.in_flight = 0
+        self.captures = 0
+        self.degraded = 0
+        self.waited = 0.0
+
+    def refill(self, now):
+        rate = self.policy.rate / self.penalty
+        self.tokens = min(self.policy.burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        return rate
+
+class CaptureSlot:
+    """Handle for one scheduled capture; report the outcome before exiting."""
+
+    def __init__(self, scheduler, key):
+        self.scheduler = scheduler
+        self.key = key
+        self.reported = False
+
+    def report(self, ok):
+        self.reported = True
+        self.scheduler.report(self.key, ok)
+
+class HostScheduler:
+    """Per-host token bucket and connection budget in front of captures.
+
+    Hosts are throttled independently, so many domains still capture in
+    parallel while any single retailer sees a bounded request rate.
+    """
+
+    def __init__(self, default_policy=None, overrides=None, max_penalty=8.0):
+        self.default_policy = default_policy or HostPolicy()
+        self.overrides = overrides or {}
+        self.max_penalty = max_penalty
+        self._hosts = {}
+
+    @classmethod
+    def from_env(cls):
+        """Build from PRICETOOL_HOST_LIMITS, a JSON object such as
+        {"amazon.com": {"rate": 0.2, "max_concurrent": 1}}."""
+        overrides = {}
+        raw = os.environ.get('PRICETOOL_HOST_LIMITS')
+        if raw:
+            try:
+                for host, limits in json.loads(raw).items():
+                    overrides[host.lower()] = HostPolicy(**limits)
+            except (ValueError, TypeError) as e:
+                logger.error(f"Ignoring invalid PRICETOOL_HOST_LIMITS: {str(e)}")
+        return cls(overrides=overrides)
+
+    def policy_for(self, key):
+        # Overrides apply to the host and its subdomains
+        parts = key.split('.')
+        for i in range(len(parts)):
+            policy = self.overrides.get('.'.join(parts[i:]))
+            if policy:
+                return policy
+        return self.default_policy
+
+    def _state(self, key):
+        state = self._hosts.get(key)
+        if state is None:
+            state = self._hosts[key] = _HostState(self.policy_for(key))
+        return state
+
+    async def _take_token(self, state):
+        async with state.lock:
+            while True:
+                now = time.monotonic()
+                rate = state.refill(now)
+                if state.tokens >= 1:
+                    state.tokens -= 1
+                    return
+                delay = (1 - state.tokens) / rate
+                state.waited += delay
+                await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def slot(self, url, adaptive=True):
+        """Wait for a token and a free connection for url's host.
+
+        With adaptive=False a failure inside the block does not count against
+        the host, for callers that only want the pacing.
+        """
+        key = host_key(url)
+        state = self._state(key)
+        async with state.semaphore:
+            await self._take_token(state)
+            slot = CaptureSlot(self, key)
+            state.in_flight += 1
+            try:
+                yield slot
+            except Exception:
+                if adaptive and not slot.reported:
+                    self.report(key, ok=False)
+                raise
+            finally:
+                state.in_flight -= 1
+
+    def report(self, key, ok):
+        """Adapt a host's pace to the outcome of a capture."""
+        state = self._state(key)
+        state.captures += 1
+        if ok:
+            state.penalty = max(1.0, state.penalty / 2)
+        else:
+            state.degraded += 1
+            state.penalty = min(self.max_penalty, state.penalty * 2)
+            logger.warning(f"Slowing captures for {key} (backoff x{state.penalty:g})")
+
+    def stats(self):
+        return {
+            key: {
+                'captures': state.captures,
+                'degraded': state.degraded,
+                'penalty': state.penalty,
+                'waited_seconds': round(state.waited, 1),
+                'in_flight': state.in_flight,
+            }
+            for key, state in self._hosts.items()
+        }
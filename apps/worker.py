@@ -0,0 +1,144 @@
+from apps.browser_service import BrowserService
+from apps.capture import add_website, refresh_website, CaptureError
+from apps.database import (
+    engine, init_db, claim_job, heartbeat_job, complete_job, fail_job, save_worker_status
+)
+from apps.precheck import ChangeDetector
+from sqlalchemy.exc import IntegrityError
+import asyncio
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+class LeaseLost(Exception):
+    """Another worker may have reclaimed the job; its results must not be written."""
+
+class Worker:
+    """Pulls capture jobs from the shared job table and runs them.
+
+    Each worker process owns one browser and runs `concurrency` job loops on
+    it. A claimed job holds a lease that is renewed by a heartbeat while it
+    runs; if the process dies, the lease expires and another worker retries
+    the job. A worker that loses a lease abandons the job without writing.
+    Per-host rate and concurrency limits are enforced across all workers
+    when jobs are claimed; the in-process scheduler only adds the adaptive
+    backoff on top.
+    """
+
+    def __init__(self, worker_id=None, concurrency=1, lease_seconds=300,
+                 poll_interval=2.0, retry_delay=60):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.error_backoff = 10
+        self.status_interval = 30
+        self.browser_service = BrowserService()
+        self.change_detector = ChangeDetector.from_env()
+
+    async def run(self):
+        logger.warning(f"Worker {self.worker_id} started with {self.concurrency} job loop(s)")
+        reporter = asyncio.create_task(self._report_status())
+        try:
+            await asyncio.gather(*(self._job_loop() for _ in range(self.concurrency)))
+        finally:
+            reporter.cancel()
+            await self.change_detector.close()
+            await self.browser_service.cleanup()
+
+    async def _job_loop(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(
+                    claim_job, self.worker_id, self.lease_seconds,
+                    self.browser_service.scheduler.policy_for
+                )
+                if not job:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self._run_job(job)
+            except Exception as e:
+                # e.g. "database is locked"; an unfinished job's lease expires
+                # and it is retried, so keep this loop alive
+                logger.error(f"Worker {self.worker_id} job loop error: {str(e)}")
+                await asyncio.sleep(self.error_backoff)
+
+    async def _run_job(self, job):
+        logger.info(f"Worker {self.worker_id} running {job.kind} job {job.id} (attempt {job.attempts})")
+        task = asyncio.create_task(self._execute(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job.id, task))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if not task.cancelled() or heartbeat.cancelled() or not heartbeat.done():
+                raise
+            # Cancelled by the heartbeat after losing the lease
+            logger.warning(f"Worker {self.worker_id} abandoned job {job.id}")
+        except LeaseLost:
+            logger.warning(f"Worker {self.worker_id} abandoned job {job.id} before writing results")
+        except (CaptureError, IntegrityError) as e:
+            # Retrying will not help: the page has no price or the item exists
+            logger.warning(f"Job {job.id} failed permanently: {str(e)}")
+            await asyncio.to_thread(fail_job, job.id, self.worker_id, str(e))
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            await asyncio.to_thread(fail_job, job.id, self.worker_id, str(e), self.retry_delay)
+        else:
+            await asyncio.to_thread(complete_job, job.id, self.worker_id, result)
+        finally:
+            heartbeat.cancel()
+            task.cancel()
+
+    async def _execute(self, job):
+        def confirm_lease():
+            # Renew the lease right before writing; raises if it was lost.
+            # Runs in the write thread together with the writes themselves
+            if not heartbeat_job(job.id, self.worker_id, self.lease_seconds):
+                raise LeaseLost(f"Lease lost on job {job.id}")
+
+        if job.kind == 'add':
+            website_id = await add_website(job.url, self.browser_service, before_write=confirm_lease)
+            return f'website {website_id}'
+        if job.kind == 'refresh':
+            outcome = await refresh_website(job.website_id, self.browser_service, self.change_detector,
+                                            before_write=confirm_lease)
+            return outcome or 'missing'
+        raise CaptureError(f"Unknown job kind: {job.kind}")
+
+    async def _report_status(self):
+        """Publish browser and pre-check stats to the DB for the web process"""
+        while True:
+            try:
+                await asyncio.to_thread(
+                    save_worker_status, self.worker_id,
+                    self.browser_service.status(), self.change_detector.stats()
+                )
+            except Exception as e:
+                logger.error(f"Worker {self.worker_id} could not save status: {str(e)}")
+            await asyncio.sleep(self.status_interval)
+
+    async def _heartbeat(self, job_id, task):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(heartbeat_job, job_id, self.worker_id, self.lease_seconds):
+                logger.warning(f"Worker {self.worker_id} lost the lease on job {job_id}")
+                task.cancel()
+                return
+
+def run_worker_process(concurrency, lease_seconds):
+    """Entry point for one worker process"""
+    logging.basicConfig(
+        level=logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    # Drop pooled connections inherited from the parent across fork()
+    engine.dispose(close=False)
+    init_db()
+    worker = Worker(concurrency=concurrency, lease_seconds=lease_seconds)
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
@@ -1,18 +1,18 @@
 #!/usr/bin/env python3
-from quart import Quart, render_template, request, jsonify
-from PIL import Image
+from quart import Quart, render_template, request, jsonify, Response, url_for
 from apps.database import (
     init_db, Website, PriceHistory, Session, 
-    record_price_update, extract_price_info, delete_website,
-    get_price_history  # Add this import
+    delete_website, get_price_history,
+    get_websites_page, get_domains, get_website_image,
+    enqueue_job, get_job_counts, get_failed_jobs, get_website_ids, get_worker_statuses
 )
-from apps.ollama import process_image
 from apps.browser_service import BrowserService
+from apps.capture import add_website, refresh_website, CaptureError
+from apps.precheck import ChangeDetector, merge_stats
 import base64
-import io
 import logging
 import json
-from datetime import datetime, timezone
+import os
 
 app = Quart(__name__)
 init_db()
@@ -23,8 +23,13 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-# Initialize browser service
+# With workers enabled (see worker.py) this process only serves the UI and
+# queues captures; otherwise it captures in-process as before
+USE_WORKERS = os.environ.get('PRICETOOL_USE_WORKERS', '').lower() in ('1', 'true', 'yes')
+
+# Initialize browser service and the HTTP pre-check that runs before captures
 browser_service = BrowserService()
+change_detector = ChangeDetector.from_env()
 
 @app.template_filter('b64encode')
 def b64encode_filter(data):
@@ -32,17 +37,67 @@ def b64encode_filter(data):
         return None
     return base64.b64encode(data).decode()
 
+# Dashboard sort options: name -> (sort column, descending)
+SORT_OPTIONS = {
+    'recent': ('updated', True),
+    'oldest': ('updated', False),
+    'drops': ('change', False),
+    'rises': ('change', True),
+}
+PAGE_SIZE = 20
+
+def dashboard_filters(args):
+    """Read the dashboard sort/filter query parameters, dropping invalid ones"""
+    filters = {'sort': args.get('sort') if args.get('sort') in SORT_OPTIONS else 'recent'}
+    if args.get('domain'):
+        filters['domain'] = args['domain']
+    if args.get('change') in ('down', 'up', 'same'):
+        filters['change'] = args['change']
+    if args.get('days', '').isdigit():
+        filters['days'] = int(args['days'])
+    return filters
+
+async def render_item_page(template, filters, cursor=None, **context):
+    sort, descending = SORT_OPTIONS[filters['sort']]
+    websites, next_cursor = get_websites_page(
+        sort=sort,
+        descending=descending,
+        domain=filters.get('domain'),
+        change=filters.get('change'),
+        updated_days=filters.get('days'),
+        cursor=cursor,
+        limit=PAGE_SIZE
+    )
+    next_url = url_for('items', cursor=next_cursor, **filters) if next_cursor else None
+    return await render_template(template,
+                                 websites=websites,
+                                 next_url=next_url,
+                                 filters=filters,
+                                 **context)
+
 @app.route('/')
 async def index():
-    session = Session()
+    # For now, show all websites since we haven't implemented user auth yet
+    return await render_item_page('index.html', dashboard_filters(request.args),
+                                  title="Modern Price Tool",
+                                  domains=get_domains())
+
+@app.route('/items')
+async def items():
+    """Next page of item cards as an HTML fragment, loaded on scroll"""
     try:
-        # For now, just get all websites since we haven't implemented user auth yet
-        websites = session.query(Website).all()
-        return await render_template('index.html', 
-                            title="Modern Price Tool",
-                            websites=websites)
-    finally:
-        session.close()
+        return await render_item_page('item_page.html', dashboard_filters(request.args),
+                                      cursor=request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+@app.route('/thumbnail/<int:website_id>')
+async def thumbnail(website_id):
+    image_data = get_website_image(website_id)
+    if image_data is None:
+        return jsonify({'error': 'Image not found'}), 404
+    return Response(image_data, mimetype='image/jpeg',
+                    headers={'Cache-Control': 'private, max-age=300'})
 
 @app.route('/add-item', methods=['POST'])
 async def add_item():
@@ -58,61 +113,17 @@ async def add_item():
         if not url.startswith(('http://', 'https://')):
             return jsonify({'error': 'Invalid URL format. URL must start with http:// or https://'}), 400
 
-        try:
-            screenshot_bytes = await browser_service.get_screenshot(url)
-            screenshot = Image.open(io.BytesIO(screenshot_bytes))
-        except Exception as e:
-            app.logger.error(f"Screenshot error: {str(e)}")
-            return jsonify({'error': 'Failed to capture screenshot'}), 500
-
-        ai_question = """Analyze the image and respond exclusively with a JSON object containing the following keys:
-                description: A brief description of the item in the image, or not found if unavailable.
-                price: The item's price in the image, or not found if unavailable.
-
-                Do not include any additional text outside the JSON object."""
-
-        ollama_response = process_image(
-            image=screenshot,
-            prompt=ai_question,
-            stream=False
-        )
-        
-        app.logger.debug(f"Ollama Response: {ollama_response}")
-        
-        # Parse JSON from the content string
-        try:
-            response = json.loads(ollama_response["message"]["content"])
-            description = response.get('description', 'not found')
-            price_str = response.get('price', 'not found')
-            
-            app.logger.debug(f"\n\nDescription: {description}, Price: {price_str}\n")
+        if USE_WORKERS:
+            enqueue_job('add', url=url)
+            return jsonify({'success': True, 'queued': True, 'message': 'Item queued for capture'})
 
-            if response.get('description') == 'This site cannot be reached' or response.get('price') == 'not found':
-                return jsonify({'error': 'Unable to access the website. Please check if the URL is valid and the site is accessible.'}), 400
-    
-            # Extract initial price info
-            price_float, currency, raw_price = extract_price_info(price_str)
-            
-            session = Session()
-            try:
-                website = Website(
-                    url=url,
-                    description=description if description != 'not found' else url,
-                    current_price=price_float,
-                    currency=currency,
-                    image_data=screenshot_bytes,
-                    last_updated=datetime.now(timezone.utc)
-                )
-                session.add(website)
-                session.commit()
-                
-                # Record initial price history
-                record_price_update(website.id, price_str, scraped_description=description)
-                
-                return jsonify({'success': True, 'message': 'Item added successfully'})
-            finally:
-                session.close()
+        try:
+            website_id = await add_website(url, browser_service)
+            app.logger.debug(f"Added website {website_id} for {url}")
+            return jsonify({'success': True, 'message': 'Item added successfully'})
 
+        except CaptureError:
+            return jsonify({'error': 'Unable to access the website. Please check if the URL is valid and the site is accessible.'}), 400
         except json.JSONDecodeError as e:
             app.logger.error(f"Failed to parse JSON response: {e}")
             return jsonify({'error': 'Failed to parse AI response'}), 500
@@ -167,6 +178,59 @@ async def update_description():
         app.logger.error(f"Error updating description: {str(e)}")
         return jsonify({'error': f'Error updating description: {str(e)}'}), 500
 
+@app.route('/refresh-item', methods=['POST'])
+async def refresh_item():
+    try:
+        data = await request.get_json()
+        if not data or 'url' not in data:
+            return jsonify({'error': 'URL is required'}), 400
+            
+        session = Session()
+        try:
+            website = session.query(Website).filter_by(url=data['url']).first()
+            website_id = website.id if website else None
+        finally:
+            session.close()
+        if website_id is None:
+            return jsonify({'error': 'Item not found'}), 404
+            
+        if USE_WORKERS:
+            enqueue_job('refresh', website_id=website_id)
+            return jsonify({'success': True, 'queued': True})
+            
+        outcome = await refresh_website(website_id, browser_service, change_detector)
+        return jsonify({'success': True, 'result': outcome})
+        
+    except CaptureError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error refreshing item: {str(e)}")
+        return jsonify({'error': f'Error refreshing item: {str(e)}'}), 500
+
+@app.route('/refresh-all', methods=['POST'])
+async def refresh_all():
+    """Queue a refresh job for every tracked website (worker mode only)"""
+    if not USE_WORKERS:
+        return jsonify({'error': 'Bulk refresh requires worker mode (PRICETOOL_USE_WORKERS=1)'}), 400
+    try:
+        job_ids = [enqueue_job('refresh', website_id=website_id) for website_id in get_website_ids()]
+        return jsonify({'success': True, 'queued': len(job_ids)})
+    except Exception as e:
+        app.logger.error(f"Error queueing refresh: {str(e)}")
+        return jsonify({'error': f'Error queueing refresh: {str(e)}'}), 500
+
+@app.route('/job-status')
+async def job_status():
+    failed = [{
+        'id': job.id,
+        'kind': job.kind,
+        'url': job.url,
+        'website_id': job.website_id,
+        'error': job.last_error,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    } for job in get_failed_jobs()]
+    return jsonify({'counts': get_job_counts(), 'failed': failed})
+
 @app.route('/price-history/<website_id>')
 async def price_history(website_id):
     try:
@@ -181,12 +245,25 @@ async def price_history(website_id):
         app.logger.error(f"Error fetching price history: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.before_serving
-async def startup():
-    await browser_service.init_browser()
+@app.route('/browser-status')
+async def browser_status():
+    if USE_WORKERS:
+        # Captures run in the workers; report what they last published
+        return jsonify({'workers': [
+            dict(status['browser'], worker_id=status['worker_id'], updated_at=status['updated_at'])
+            for status in get_worker_statuses()
+        ]})
+    return jsonify(browser_service.status())
+
+@app.route('/precheck-status')
+async def precheck_status():
+    if USE_WORKERS:
+        return jsonify(merge_stats(status['precheck'] for status in get_worker_statuses()))
+    return jsonify(change_detector.stats())
 
 @app.after_serving
 async def shutdown():
+    await change_detector.close()
     await browser_service.cleanup()
 
 if __name__ == "__main__":
@@ -63,12 +63,56 @@ async function loadPriceHistory(websiteId) {
     }
 }
 
-document.addEventListener('DOMContentLoaded', function() {
-    // Initialize price history charts
-    document.querySelectorAll('[id^="priceChart"]').forEach(canvas => {
-        const websiteId = canvas.id.replace('priceChart', '');
-        loadPriceHistory(websiteId);
+// Create each chart only once its card scrolls into view
+const chartObserver = new IntersectionObserver((entries, observer) => {
+    entries.forEach(entry => {
+        if (entry.isIntersecting) {
+            observer.unobserve(entry.target);
+            loadPriceHistory(entry.target.dataset.websiteId);
+        }
     });
+}, { rootMargin: '200px' });
+
+// Fetch the next page of cards when the sentinel at the end of the list is reached
+const pageObserver = new IntersectionObserver((entries, observer) => {
+    entries.forEach(entry => {
+        if (entry.isIntersecting) {
+            observer.unobserve(entry.target);
+            loadNextPage(entry.target);
+        }
+    });
+}, { rootMargin: '400px' });
+
+function observePage(root) {
+    root.querySelectorAll('canvas[data-website-id]').forEach(canvas => chartObserver.observe(canvas));
+    root.querySelectorAll('.page-sentinel').forEach(sentinel => pageObserver.observe(sentinel));
+}
+
+async function loadNextPage(sentinel) {
+    try {
+        const response = await fetch(sentinel.dataset.nextUrl);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const template = document.createElement('template');
+        template.innerHTML = await response.text();
+        observePage(template.content);
+        sentinel.replaceWith(template.content);
+    } catch (error) {
+        console.error('Error loading more items:', error);
+        sentinel.remove();
+    }
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Lazily initialize price history charts and infinite scrolling
+    observePage(document);
+
+    // Apply sort and filter changes immediately
+    const filterForm = document.getElementById('filterForm');
+    if (filterForm) {
+        filterForm.addEventListener('change', () => filterForm.submit());
+    }
 
     // Add Item Form Handling
     const addItemForm = document.getElementById('addItemForm');
@@ -158,6 +202,35 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Refresh Item Handling
+    window.refreshItem = async function(button, url) {
+        const icon = button.querySelector('i');
+        button.disabled = true;
+        icon.classList.add('fa-spin');
+        try {
+            const response = await fetch('/refresh-item', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ url: url })
+            });
+            
+            if (response.ok) {
+                window.location.reload();
+            } else {
+                const data = await response.json();
+                alert(data.error || 'Error refreshing item');
+            }
+        } catch (error) {
+            console.error('Error:', error);
+            alert('Error refreshing item');
+        } finally {
+            button.disabled = false;
+            icon.classList.remove('fa-spin');
+        }
+    };
+
     // Edit Description Handling
     const editModal = document.getElementById('editDescriptionModal');
     const editForm = document.getElementById('editDescriptionForm');
@@ -166,15 +239,15 @@ document.addEventListener('DOMContentLoaded', function() {
     const errorMessage = document.getElementById('editErrorMessage');
     
     if (editModal && editForm) {
-        // When edit button is clicked
-        document.querySelectorAll('.edit-description').forEach(button => {
-            button.addEventListener('click', function() {
-                const url = this.dataset.url;
-                const description = this.dataset.description;
-                descInput.value = description;
-                urlInput.value = url;
-                errorMessage.classList.add('d-none');
-            });
+        // When edit button is clicked (cards may be added after page load)
+        editModal.addEventListener('show.bs.modal', function(event) {
+            const button = event.relatedTarget;
+            if (!button) {
+                return;
+            }
+            descInput.value = button.dataset.description;
+            urlInput.value = button.dataset.url;
+            errorMessage.classList.add('d-none');
         });
         
         // When save button is clicked
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Run capture/extract workers for the job queue.
+
+Start the web UI with PRICETOOL_USE_WORKERS=1 so it only queues captures,
+then run this on one or more machines sharing the database:
+
+    python worker.py --processes 4
+"""
+from apps.worker import run_worker_process
+from apps.database import init_db
+import argparse
+import multiprocessing
+
+def main():
+    parser = argparse.ArgumentParser(description='Run price capture workers')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Concurrent jobs per process, sharing its browser')
+    parser.add_argument('--lease', type=int, default=300,
+                        help='Seconds a claimed job is leased before another worker may retry it')
+    args = parser.parse_args()
+
+    init_db()
+    processes = [
+        multiprocessing.Process(target=run_worker_process, args=(args.concurrency, args.lease))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()